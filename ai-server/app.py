@@ -1,7 +1,6 @@
 # ai-server/app.py
 from flask import Flask, request, jsonify, Response
 import torch
-import base64
 import cv2
 import numpy as np
 from PIL import Image
@@ -9,6 +8,7 @@ import io
 import json
 import logging
 from flask_cors import CORS
+from image_codec import decode_base64_image, encode_frame_base64
 
 app = Flask(__name__)
 CORS(app)
@@ -51,28 +51,6 @@ except Exception as e:
     logger.error(f"Failed to initialize model: {str(e)}")
     raise
 
-def decode_base64_image(base64_string):
-    try:
-        img_data = base64.b64decode(base64_string)
-        nparr = np.frombuffer(img_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if img is None:
-            raise ValueError("Failed to decode image")
-        return img
-    except Exception as e:
-        logger.error(f"Error decoding image: {str(e)}")
-        return None
-
-def encode_frame_base64(frame):
-    try:
-        if frame is None:
-            raise ValueError("Frame is None")
-        _, buffer = cv2.imencode('.jpg', frame)
-        return base64.b64encode(buffer).decode('utf-8')
-    except Exception as e:
-        logger.error(f"Error encoding frame: {str(e)}")
-        return None
-
 @app.route('/detect', methods=['POST'])
 def detect_fire():
     try:
@@ -0,0 +1,409 @@
+# ai-server/evaluate.py
+"""Offline replay of a directory of images/videos through the /detect path.
+
+Frames are decoded in a process pool and fed to FireDetectionModel in the
+main process, so the numbers reflect the same decode -> model -> detection
+work the AI service does per request.
+
+Usage:
+    python evaluate.py DATASET_DIR [--labels labels.csv] [--workers 4]
+
+The labels file is a CSV of `path,label` rows, where `path` is relative to
+DATASET_DIR and `label` is 1 (fire) or 0 (no fire). A video's label applies
+to every frame sampled from it.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from image_codec import decode_image_bytes
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.h264'}
+
+# Same threshold as AlarmHandler.handle_fire_detection on the RPi server
+DEFAULT_THRESHOLD = 0.7
+
+# The RPi camera runs at 30 FPS and sends one frame per second to /detect
+DEFAULT_FRAME_STRIDE = 30
+
+# Sampled video frames sent back per message; bounds memory held in flight
+CHUNK_FRAMES = 16
+
+def iter_media_files(root: str) -> Iterator[str]:
+    """Yield image and video paths under root, relative to it, in sorted order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in IMAGE_EXTENSIONS or ext in VIDEO_EXTENSIONS:
+                yield os.path.relpath(os.path.join(dirpath, name), root)
+
+def _seek(capture, frame: int) -> bool:
+    """Seek to a raw frame, checking the backend actually landed there"""
+    return capture.set(cv2.CAP_PROP_POS_FRAMES, frame) and int(capture.get(cv2.CAP_PROP_POS_FRAMES)) == frame
+
+def _split_video(capture, task: tuple, frame_stride: int, max_parts: int, results) -> Optional[int]:
+    """Hand later ranges of a long, seekable video to other workers
+
+    Only done when the container reports a frame count and really seeks;
+    raw streams such as .h264 are read start to finish by one worker
+    instead. Returns the frame this task should stop at, or None for EOF.
+    """
+    task_id, rel_path, _, _ = task
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    # Each part should be worth at least one chunk of sampled frames
+    parts = min(max_parts, frame_count // (CHUNK_FRAMES * frame_stride)) if frame_count > 0 else 0
+    if parts < 2:
+        return None
+    step = -(-frame_count // parts)
+    step += -step % frame_stride  # keep boundaries on sampled frames
+    if not _seek(capture, step) or not _seek(capture, 0):
+        return None
+    starts = list(range(step, frame_count, step))
+    # The last range reads to EOF in case the header undercounts
+    ranges = [(s, s + step) for s in starts[:-1]] + [(starts[-1], None)]
+    results.put(('split', task_id, rel_path, ranges))
+    return step
+
+def _stream_video(capture, task: tuple, frame_stride: int, max_parts: int, results):
+    """Read raw frames [start, end) in order, sending every frame_stride-th one
+
+    Frames are round-tripped through JPEG to match what CameraHandler sends
+    to the AI service, and sent back in chunks of CHUNK_FRAMES.
+    """
+    task_id, rel_path, start, end = task
+    if start == 0 and end is None:
+        end = _split_video(capture, task, frame_stride, max_parts, results)
+    elif start and not _seek(capture, start):
+        raise ValueError(f"Could not seek to frame {start}")
+    chunk = []
+    sent = 0
+    index = start
+    while end is None or index < end:
+        ret, frame = capture.read()
+        if not ret:
+            break
+        if index % frame_stride == 0:
+            _, buffer = cv2.imencode('.jpg', frame)
+            chunk.append(decode_image_bytes(buffer.tobytes()))
+            if len(chunk) >= CHUNK_FRAMES:
+                results.put(('frames', task_id, rel_path, chunk))
+                sent += len(chunk)
+                chunk = []
+        index += 1
+    if chunk:
+        results.put(('frames', task_id, rel_path, chunk))
+        sent += len(chunk)
+    if start == 0 and not sent:
+        raise ValueError("No frames could be read")
+
+def _decode_worker(root: str, frame_stride: int, max_parts: int, tasks, results):
+    """Decode tasks from `tasks` until a None sentinel, streaming to `results`
+
+    A task is (task_id, rel_path, start, end); images have start None and
+    videos cover raw frames [start, end), with end None meaning EOF. Every
+    task ends with a ('done', task_id, rel_path, error) message.
+    """
+    # Each worker decodes one file at a time; keep OpenCV from oversubscribing cores
+    cv2.setNumThreads(1)
+    for task in iter(tasks.get, None):
+        task_id, rel_path, start, _ = task
+        path = os.path.join(root, rel_path)
+        error = None
+        try:
+            if start is None:
+                with open(path, 'rb') as f:
+                    results.put(('frames', task_id, rel_path, [decode_image_bytes(f.read())]))
+            else:
+                capture = cv2.VideoCapture(path)
+                if not capture.isOpened():
+                    raise ValueError("Could not open video")
+                try:
+                    _stream_video(capture, task, frame_stride, max_parts, results)
+                finally:
+                    capture.release()
+        except Exception as e:
+            error = str(e)
+        results.put(('done', task_id, rel_path, error))
+
+@dataclass
+class _Worker:
+    process: multiprocessing.Process
+    tasks: multiprocessing.Queue
+    task: Optional[tuple] = None
+
+class DecodePipeline:
+    """Decode files in worker processes, yielding (path, frame) as they arrive
+
+    Each video is read once, in order, by one worker; long videos in
+    containers that report a frame count and seek accurately are split
+    across idle workers. Frames come back in chunks of CHUNK_FRAMES through
+    a queue holding at most 2 * workers chunks, so memory is bounded by
+    frames rather than by file length.
+
+    Workers are spawned rather than forked: by the time they start the
+    parent holds torch threads, the model and possibly a CUDA context, none
+    of which are safe to fork. The parent assigns each task to a specific
+    worker, so if one dies (e.g. OpenCV crashing on a corrupt container) its
+    task is recorded as a decode failure, a replacement is started and the
+    run carries on.
+
+    Every file seen is recorded in `files`, and files that failed to decode
+    in `failed_files`, so the report can account for frames that never
+    reached the model.
+    """
+    def __init__(self, root: str, workers: int, frame_stride: int):
+        self.root = root
+        self.workers = workers
+        self.frame_stride = frame_stride
+        self.files = []
+        self.failed_files = {}
+        self._context = multiprocessing.get_context('spawn')
+        self._results = None
+        self._workers = []
+        self._task_ids = itertools.count()
+
+    def __iter__(self) -> Iterator[Tuple[str, np.ndarray]]:
+        self._results = self._context.Queue(maxsize=2 * self.workers)
+        self._workers = [self._start_worker() for _ in range(self.workers)]
+        ready = deque()  # video ranges split off by workers, served before new files
+        paths = iter_media_files(self.root)
+        try:
+            while True:
+                self._reap_crashed()
+                self._dispatch(ready, paths)
+                if not any(worker.task for worker in self._workers):
+                    break
+                try:
+                    kind, task_id, rel_path, payload = self._results.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if kind == 'frames':
+                    for frame in payload:
+                        yield rel_path, frame
+                elif kind == 'split':
+                    ready.extendleft((rel_path, start, end) for start, end in reversed(payload))
+                elif kind == 'done':
+                    self._finish(task_id, rel_path, payload)
+        finally:
+            self._shutdown()
+
+    def _start_worker(self) -> _Worker:
+        tasks = self._context.Queue()
+        process = self._context.Process(
+            target=_decode_worker,
+            args=(self.root, self.frame_stride, self.workers, tasks, self._results),
+            daemon=True)
+        process.start()
+        return _Worker(process, tasks)
+
+    def _dispatch(self, ready: deque, paths: Iterator[str]):
+        for worker in self._workers:
+            if worker.task is not None:
+                continue
+            if ready:
+                rel_path, start, end = ready.popleft()
+            else:
+                rel_path = next(paths, None)
+                if rel_path is None:
+                    return
+                self.files.append(rel_path)
+                is_image = os.path.splitext(rel_path)[1].lower() in IMAGE_EXTENSIONS
+                start, end = (None, None) if is_image else (0, None)
+            worker.task = (next(self._task_ids), rel_path, start, end)
+            worker.tasks.put(worker.task)
+
+    def _finish(self, task_id: int, rel_path: str, error: Optional[str]):
+        for worker in self._workers:
+            if worker.task is not None and worker.task[0] == task_id:
+                worker.task = None
+                break
+        if error is not None:
+            self._record_failure(rel_path, error)
+
+    def _reap_crashed(self):
+        for i, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                continue
+            if worker.task is not None:
+                self._record_failure(
+                    worker.task[1], f"Decode worker crashed (exit code {worker.process.exitcode})")
+            self._workers[i] = self._start_worker()
+
+    def _shutdown(self):
+        for worker in self._workers:
+            worker.tasks.put(None)
+        for worker in self._workers:
+            # Workers can be blocked on a full results queue if iteration stopped early
+            worker.process.join(timeout=1.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    def _record_failure(self, rel_path: str, error: str):
+        logger.error(f"Error decoding {rel_path}: {error}")
+        self.failed_files.setdefault(rel_path, error)
+
+def load_labels(labels_path: str) -> Dict[str, bool]:
+    """Read a `path,label` CSV into a mapping of relative path -> has fire"""
+    labels = {}
+    with open(labels_path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) < 2:
+                raise ValueError(f"Malformed label row: {row}")
+            path, value = row[0].strip(), row[1].strip().lower()
+            if path == 'path':  # header
+                continue
+            if value not in ('0', '1', 'true', 'false'):
+                raise ValueError(f"Invalid label '{row[1]}' for {path}")
+            labels[os.path.normpath(path)] = value in ('1', 'true')
+    return labels
+
+def percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+def evaluate(model, frames: Iterator[Tuple[str, np.ndarray]],
+             labels: Optional[Dict[str, bool]] = None,
+             threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """Run frames through the model and collect throughput, latency and accuracy"""
+    latencies = []
+    tp = fp = fn = tn = unlabeled = 0
+    start = time.perf_counter()
+
+    for rel_path, frame in frames:
+        frame_start = time.perf_counter()
+        detections, _ = model.process_frame(frame)
+        latencies.append((time.perf_counter() - frame_start) * 1000)
+
+        if labels is None:
+            continue
+        label = labels.get(os.path.normpath(rel_path))
+        if label is None:
+            unlabeled += 1
+            continue
+        # Mirrors CameraHandler: the alarm sees the highest-confidence detection
+        max_confidence = max((det['confidence'] for det in detections), default=0.0)
+        predicted = max_confidence >= threshold
+        if predicted and label:
+            tp += 1
+        elif predicted:
+            fp += 1
+        elif label:
+            fn += 1
+        else:
+            tn += 1
+
+    elapsed = time.perf_counter() - start
+    report = {
+        'frames': len(latencies),
+        'elapsed_s': round(elapsed, 3),
+        'images_per_sec': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'mean': round(float(np.mean(latencies)), 2) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 2),
+            'p90': round(percentile(latencies, 90), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2) if latencies else 0.0,
+        },
+    }
+    if labels is not None:
+        report['accuracy'] = {
+            'threshold': threshold,
+            'tp': tp, 'fp': fp, 'fn': fn, 'tn': tn,
+            'unlabeled': unlabeled,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else 0.0,
+            'recall': round(tp / (tp + fn), 4) if tp + fn else 0.0,
+        }
+    return report
+
+def decode_summary(pipeline: DecodePipeline, labels: Optional[Dict[str, bool]] = None) -> dict:
+    """Describe files and labels that could not be scored"""
+    summary = {
+        'files': len(pipeline.files),
+        'decode_errors': len(pipeline.failed_files),
+        'failed_files': dict(sorted(pipeline.failed_files.items())),
+    }
+    if labels is not None:
+        # Failed files contribute fewer frames (often none) than their label implies
+        summary['labeled_files_lost'] = sorted(
+            path for path in pipeline.failed_files if os.path.normpath(path) in labels)
+        seen = {os.path.normpath(path) for path in pipeline.files}
+        summary['labels_without_file'] = sorted(path for path in labels if path not in seen)
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a dataset through FireDetectionModel")
+    parser.add_argument('dataset', help="Directory of images and/or videos")
+    parser.add_argument('--labels', help="CSV of path,label rows (1 = fire, 0 = no fire)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Decode worker processes")
+    parser.add_argument('--frame-stride', type=int, default=DEFAULT_FRAME_STRIDE,
+                        help="Evaluate every Nth video frame")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Confidence at which a frame counts as fire")
+    parser.add_argument('--warmup', type=int, default=3,
+                        help="Frames run before timing starts")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if not os.path.isdir(args.dataset):
+        logger.error(f"Dataset directory not found: {args.dataset}")
+        return 1
+    if args.workers < 1 or args.frame_stride < 1:
+        logger.error("--workers and --frame-stride must be at least 1")
+        return 1
+    if args.warmup < 0:
+        logger.error("--warmup must not be negative")
+        return 1
+
+    labels = load_labels(args.labels) if args.labels else None
+
+    # Imported here, not at module level, so spawned decode workers that
+    # re-import this module never pull in torch or load the model
+    from app import model
+
+    pipeline = DecodePipeline(args.dataset, args.workers, args.frame_stride)
+    frames = iter(pipeline)
+
+    # Warm up on the first frames (CUDA init, cudnn autotune) but still score them
+    warmup = list(itertools.islice(frames, args.warmup))
+    for _, frame in warmup:
+        model.process_frame(frame)
+
+    def replay():
+        yield from warmup
+        yield from frames
+
+    report = evaluate(model, replay(), labels, args.threshold)
+    report['decode'] = decode_summary(pipeline, labels)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,33 @@
+# ai-server/image_codec.py
+import base64
+import cv2
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+def decode_image_bytes(img_data):
+    """Decode encoded image bytes (JPEG/PNG/...) into a BGR frame"""
+    nparr = np.frombuffer(img_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Failed to decode image")
+    return img
+
+def decode_base64_image(base64_string):
+    try:
+        img_data = base64.b64decode(base64_string)
+        return decode_image_bytes(img_data)
+    except Exception as e:
+        logger.error(f"Error decoding image: {str(e)}")
+        return None
+
+def encode_frame_base64(frame):
+    try:
+        if frame is None:
+            raise ValueError("Frame is None")
+        _, buffer = cv2.imencode('.jpg', frame)
+        return base64.b64encode(buffer).decode('utf-8')
+    except Exception as e:
+        logger.error(f"Error encoding frame: {str(e)}")
+        return None